@@ -1,7 +1,19 @@
+import csv
+import hashlib
+import io
+import re
+import shutil
+import time
+from pathlib import Path
+from types import MappingProxyType
+
+import numpy as np
 import streamlit as st
 import pandas as pd
-import gspread
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2.service_account import Credentials
+from pyarrow import csv as pacsv
+from requests.adapters import HTTPAdapter
 
 st.set_page_config(page_title="Grades Viewer", page_icon="📘", layout="centered")
 
@@ -20,17 +32,63 @@ require_secret("id_column")
 require_secret("grade_columns")
 require_secret("gcp_service_account")
 
-SHEET_ID = st.secrets["sheet_id"]
+# Compiled once at import; sheet_id may be either a bare ID or the full
+# spreadsheet URL pasted from the browser.
+_SHEET_ID_RE = re.compile(r"/spreadsheets/d/([a-zA-Z0-9-_]+)")
+_GID_RE = re.compile(r"gid=([0-9]+)")
+
+_sheet_ref = st.secrets["sheet_id"]
+_id_match = _SHEET_ID_RE.search(_sheet_ref)
+_gid_match = _GID_RE.search(_sheet_ref)
+
+SHEET_ID = _id_match.group(1) if _id_match else _sheet_ref
 ID_COL = st.secrets["id_column"]
-GRADE_COLUMNS = dict(st.secrets["grade_columns"])  # label -> column header
+WORKSHEET_GID = (
+    _gid_match.group(1) if _gid_match else st.secrets.get("worksheet_gid", None)
+)
 WORKSHEET_NAME = st.secrets.get("worksheet_name", None)
 
+# Secrets are read-only anyway, so copy them out exactly once and freeze the
+# result instead of rebuilding dicts on every rerun.
+_gc_raw = st.secrets["grade_columns"]
+GRADE_COLUMNS = MappingProxyType({k: _gc_raw[k] for k in _gc_raw})  # label -> column header
+GRADE_LABELS = tuple(GRADE_COLUMNS)
+
 # OPTIONAL secret (you will configure this):
 # [grade_details]
 # "Prelim Grade" = ["Prelim SW (20%)", "Prelim Q (30%)", "Prelim Exam (50%)"]
-GRADE_DETAILS = dict(st.secrets.get("grade_details", {}))
-
-def get_gspread_client() -> gspread.Client:
+_gd_raw = st.secrets.get("grade_details", {})
+GRADE_DETAILS = MappingProxyType({k: tuple(_gd_raw[k]) for k in _gd_raw})
+
+# Only these columns are ever looked up or displayed; everything else in
+# the sheet can be skipped at parse time.
+NEEDED_COLS = frozenset(
+    {ID_COL}
+    | set(GRADE_COLUMNS.values())
+    | {c for cols in GRADE_DETAILS.values() for c in cols}
+)
+
+# Second-tier cache on local disk: survives process restarts, reused until
+# the sheet's Drive modifiedTime changes.
+CACHE_DIR = Path.home() / ".cache" / "grades_viewer"
+
+# Bump whenever the cached frame's layout changes (derived columns, dtypes);
+# the column hash invalidates the cache when the secrets config changes even
+# though the sheet itself has not.
+_CACHE_FORMAT_VERSION = "2"
+
+def cache_stamp(modified_time: str, gid: str) -> str:
+    columns = hashlib.sha256("|".join(sorted(NEEDED_COLS)).encode()).hexdigest()[:12]
+    return f"{modified_time}\n{_CACHE_FORMAT_VERSION}:{columns}:{gid}"
+
+SHEET_TTL_SECONDS = 60
+
+@st.cache_resource
+def get_authorized_session() -> AuthorizedSession:
+    # One session per process: HTTP keep-alive reuses the TLS connection to
+    # docs.google.com, skipping the handshake on every fetch after the first.
+    # cache_resource (unlike cache_data) keeps the live object un-serialized,
+    # which is what a session with an open connection pool needs.
     sa_info = dict(st.secrets["gcp_service_account"])
 
     scopes = [
@@ -38,113 +96,293 @@ def get_gspread_client() -> gspread.Client:
         "https://www.googleapis.com/auth/drive.readonly",
     ]
     creds = Credentials.from_service_account_info(sa_info, scopes=scopes)
-    return gspread.authorize(creds)
+    session = AuthorizedSession(creds)
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    return session
+
+@st.cache_data
+def resolve_worksheet_gid(_session) -> str:
+    # Precedence: gid from the sheet URL or worksheet_gid secret, then a
+    # worksheet_name resolved to its gid with one metadata call (kept for
+    # deployments that predate the CSV-export path), then the first tab.
+    if WORKSHEET_GID is not None:
+        return str(WORKSHEET_GID)
+    if WORKSHEET_NAME:
+        resp = _session.get(
+            f"https://sheets.googleapis.com/v4/spreadsheets/{SHEET_ID}",
+            params={"fields": "sheets.properties"},
+            timeout=10,
+        )
+        resp.raise_for_status()
+        for sheet in resp.json().get("sheets", []):
+            props = sheet.get("properties", {})
+            if props.get("title") == WORKSHEET_NAME:
+                return str(props["sheetId"])
+        raise ValueError(
+            f"Worksheet '{WORKSHEET_NAME}' not found in the spreadsheet."
+        )
+    return "0"
+
+def build_csv_export_url(gid: str) -> str:
+    return (
+        f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export"
+        f"?format=csv&gid={gid}"
+    )
+
+def get_sheet_modified_time(session: AuthorizedSession) -> str:
+    resp = session.get(
+        f"https://www.googleapis.com/drive/v3/files/{SHEET_ID}",
+        params={"fields": "modifiedTime"},
+        timeout=10,
+    )
+    resp.raise_for_status()
+    return resp.json()["modifiedTime"]
 
-@st.cache_data(ttl=60)
 def load_sheet() -> pd.DataFrame:
-    gc = get_gspread_client()
-    sh = gc.open_by_key(SHEET_ID)
-
-    ws = sh.worksheet(WORKSHEET_NAME) if WORKSHEET_NAME else sh.get_worksheet(0)
-
-    records = ws.get_all_records()  # expects header row
-    df = pd.DataFrame(records)
-    df.columns = [str(c).strip() for c in df.columns]
-    return df
-
-def find_student(df: pd.DataFrame, last6: str) -> pd.DataFrame:
-    ids = df[ID_COL].astype(str).str.replace(".0", "", regex=False).str.strip()
-    return df[ids.str[-6:] == last6].copy()
-
-# ---- UI
-st.title("ASE 4256 Grades Viewer")
-st.caption("Enter the **last 6 digits** of your ID Number and select what you want to view.")
-
-grade_labels = list(GRADE_COLUMNS.keys())
-
-with st.form("lookup_form"):
-    last6 = st.text_input("Last 6 digits of ID", max_chars=6, placeholder="e.g., 123456")
-    selected_label = st.selectbox("Select grade item", grade_labels, index=0)
-    submitted = st.form_submit_button("View Grade")
+    session = get_authorized_session()
+    gid = resolve_worksheet_gid(session)
 
-if submitted:
-    last6 = (last6 or "").strip()
-    if not (last6.isdigit() and len(last6) == 6):
-        st.error("Please enter exactly **6 digits** (numbers only).")
-        st.stop()
+    cache_path = CACHE_DIR / f"{SHEET_ID}.parquet"
+    stamp_path = CACHE_DIR / f"{SHEET_ID}.etag"
 
+    # Cheap metadata call first: if the sheet hasn't changed since the last
+    # fetch, reuse the on-disk copy instead of re-downloading the CSV.
     try:
-        df = load_sheet()
-    except Exception as e:
-        st.error("Could not load the Google Sheet using the service account.")
-        st.exception(e)
-        st.stop()
-
-    # Validate columns exist
-    if ID_COL not in df.columns:
-        st.error(f"ID column '{ID_COL}' not found.")
-        st.write("Columns found:", list(df.columns))
-        st.stop()
-
-    target_col = GRADE_COLUMNS[selected_label]
-    if target_col not in df.columns:
-        st.error(f"Grade column '{target_col}' not found (configured as '{selected_label}').")
-        st.write("Columns found:", list(df.columns))
-        st.stop()
-
-    matches = find_student(df, last6)
-
-    if matches.empty:
-        st.warning("No record found for that ID (last 6 digits). Please double-check.")
-        st.stop()
-
-    if len(matches) > 1:
-        st.warning("Multiple records matched that last-6 ID pattern. Please contact your instructor.")
-        st.stop()
-
-    row = matches.iloc[0]
-    value = row.get(target_col, "")
-
-    st.success("Record found ✅")
-    st.metric(label=selected_label, value=str(value))
-
-    # ---- Policy note (shown only for Prelim Grade)
-    if selected_label.lower() == "prelim grade":
-        st.info(
-        "📌 **Important:** The Prelim Grade shown is based strictly on the computed "
-        "values in the grading sheet. **No rounding up or manual adjustment** "
-        "has been applied."
+        modified_time = get_sheet_modified_time(session)
+    except Exception:
+        modified_time = None
+
+    if (
+        modified_time
+        and cache_path.exists()
+        and stamp_path.exists()
+        and stamp_path.read_text() == cache_stamp(modified_time, gid)
+    ):
+        return pd.read_parquet(cache_path)
+
+    resp = session.get(build_csv_export_url(gid), timeout=10)
+    resp.raise_for_status()
+    content = resp.content
+
+    # Arrow's include_columns wants the raw (unstripped) header names, so
+    # read the header row first and match on the stripped form.
+    raw_header = next(csv.reader([content.split(b"\n", 1)[0].decode("utf-8-sig")]))
+
+    # Fail on a misconfigured sheet after reading one line, not after
+    # parsing the whole body. Breakdown columns stay optional; the UI
+    # already warns about those.
+    stripped = {str(name).strip() for name in raw_header}
+    missing = sorted({ID_COL, *GRADE_COLUMNS.values()} - stripped)
+    if missing:
+        raise ValueError(
+            f"Sheet is missing required columns {missing}. "
+            f"Columns found: {sorted(stripped)}"
         )
 
+    include = [name for name in raw_header if str(name).strip() in NEEDED_COLS]
+
+    table = pacsv.read_csv(
+        io.BytesIO(content),
+        convert_options=pacsv.ConvertOptions(include_columns=include),
+    )
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
+    df.columns = [str(c).strip() for c in df.columns]
 
-    # ---- Transparency feature (no computation): show precomputed breakdown columns
-    detail_cols = GRADE_DETAILS.get(selected_label, [])
-    if detail_cols:
-        st.subheader("Breakdown (precomputed)")
+    # One Arrow regex pass captures the last six digits of every ID, however
+    # the cell is formatted ("2023123456", "2023123456.0", "2023-123456").
+    # All lookups run against this column, so the ID column itself only has
+    # to look right for display.
+    if ID_COL in df.columns:
+        df["_id6"] = (
+            df[ID_COL]
+            .astype("string[pyarrow]")
+            .str.extract(r"(\d{6})(?=(?:\.0)?\s*$)", expand=False)
+        )
 
-        missing = [c for c in detail_cols if c not in df.columns]
-        if missing:
-            st.warning(f"Some breakdown columns are missing in the sheet: {missing}")
+        # Nullable Int64 keeps IDs as integers even when the column has blanks
+        # (plain int64 would silently become float and grow a ".0" suffix).
+        # Coerce via object dtype: on an Arrow-backed column to_numeric
+        # returns double[pyarrow], whose isna() does not count the NaNs that
+        # mark coercion failures, which would defeat the mixed-format guard
+        # below and null out every non-numeric ID.
+        numeric = pd.to_numeric(df[ID_COL].astype(object), errors="coerce")
+        if numeric.isna().sum() == df[ID_COL].isna().sum():
+            df[ID_COL] = numeric.astype("Int64")
+        else:
+            # Mixed-format IDs (e.g. "2023-123456") would be dropped by the
+            # numeric coercion; keep them as Arrow-backed strings so the
+            # replace/strip cleanup runs in vectorized C kernels.
+            df[ID_COL] = (
+                df[ID_COL]
+                .astype("string[pyarrow]")
+                .str.replace(".0", "", regex=False)
+                .str.strip()
+            )
+
+    if modified_time:
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            df.to_parquet(cache_path)
+            stamp_path.write_text(cache_stamp(modified_time, gid))
+        except Exception:
+            pass  # disk cache is best-effort; the fresh df is still good
 
-        present_cols = [c for c in detail_cols if c in df.columns]
+    return df
 
-        # Show as metrics (quick to read)
-        for c in present_cols:
-            st.metric(label=c, value=str(row.get(c, "")))
+def get_sheet() -> pd.DataFrame:
+    # st.session_state holds the parsed objects by reference, so reruns skip
+    # the pickling-based hashing st.cache_data performs on every retrieval.
+    ss = st.session_state
+    if (
+        "sheet_df" not in ss
+        or time.time() - ss["sheet_loaded_at"] > SHEET_TTL_SECONDS
+    ):
+        df = load_sheet()
+        ss["sheet_df"] = df
+        ss["sheet_index"] = build_id_index(df) if "_id6" in df.columns else None
+        ss["sheet_views"] = build_views(df) if ID_COL in df.columns else {}
+        ss["sheet_loaded_at"] = time.time()
+    return ss["sheet_df"]
+
+def clear_sheet_cache() -> None:
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    for key in ("sheet_df", "sheet_index", "sheet_views", "sheet_loaded_at"):
+        st.session_state.pop(key, None)
+
+def build_views(df: pd.DataFrame):
+    # Narrow (ID, grade) frames per configured label, built once per loaded
+    # df so a submit reads its scalar from a two-column view instead of
+    # re-slicing the full sheet.
+    return {
+        label: df[[ID_COL, col]]
+        for label, col in GRADE_COLUMNS.items()
+        if col in df.columns
+    }
+
+def build_id_index(df: pd.DataFrame):
+    # Sort the precomputed _id6 column once per loaded df; a lookup is then
+    # two binary searches instead of an equality scan, and the [lo:hi) slice
+    # naturally yields every matching row, so no separate duplicate counting
+    # is needed.
+    id6 = df["_id6"].fillna("").to_numpy()
+    order = np.argsort(id6, kind="stable")
+    return order, id6[order]
 
-        # Show as a table (optional)
-        with st.expander("View breakdown as table"):
-            show_cols = [ID_COL, target_col] + present_cols
-            safe_df = matches[show_cols].copy()
+def find_student(df: pd.DataFrame, last6: str) -> pd.DataFrame:
+    order, sorted_id6 = st.session_state["sheet_index"]
+    lo = np.searchsorted(sorted_id6, last6, side="left")
+    hi = np.searchsorted(sorted_id6, last6, side="right")
+    # Callers only read from the result (scalars and display frames built
+    # from them), so no defensive copy is needed.
+    return df.iloc[order[lo:hi]]
 
-            # Rename for display
-            rename_map = {target_col: selected_label}
-            safe_df = safe_df.rename(columns=rename_map)
+# ---- UI
+st.title("ASE 4256 Grades Viewer")
+st.caption("Enter the **last 6 digits** of your ID Number and select what you want to view.")
 
+if st.sidebar.button("Clear cache"):
+    clear_sheet_cache()
+    st.sidebar.success("Cache cleared. The next lookup will re-fetch the sheet.")
+
+try:
+    get_sheet()
+except Exception as e:
+    st.error("Could not load the Google Sheet using the service account.")
+    st.exception(e)
+    st.stop()
+
+@st.fragment
+def lookup_fragment():
+    with st.form("lookup_form"):
+        last6 = st.text_input("Last 6 digits of ID", max_chars=6, placeholder="e.g., 123456")
+        selected_label = st.selectbox("Select grade item", GRADE_LABELS, index=0)
+        submitted = st.form_submit_button("View Grade")
+
+    if submitted:
+        last6 = (last6 or "").strip()
+        if not (last6.isdigit() and len(last6) == 6):
+            st.error("Please enter exactly **6 digits** (numbers only).")
+            st.stop()
+
+        df = st.session_state["sheet_df"]
+
+        # Validate columns exist
+        if ID_COL not in df.columns:
+            st.error(f"ID column '{ID_COL}' not found.")
+            st.write("Columns found:", list(df.columns))
+            st.stop()
+
+        target_col = GRADE_COLUMNS[selected_label]
+        if target_col not in df.columns:
+            st.error(f"Grade column '{target_col}' not found (configured as '{selected_label}').")
+            st.write("Columns found:", list(df.columns))
+            st.stop()
+
+        matches = find_student(df, last6)
+
+        if matches.empty:
+            st.warning("No record found for that ID (last 6 digits). Please double-check.")
+            st.stop()
+
+        if len(matches) > 1:
+            st.warning("Multiple records matched that last-6 ID pattern. Please contact your instructor.")
+            st.stop()
+
+        # One Series-to-dict conversion; every later access is a plain
+        # dict hash hit instead of label-based pandas indexing.
+        row_dict = matches.iloc[0].to_dict()
+        view = st.session_state["sheet_views"].get(selected_label)
+        if view is not None:
+            # Scalar pulled from the precomputed two-column view.
+            value = view.at[matches.index[0], target_col]
+        else:
+            value = row_dict.get(target_col, "")
+
+        st.success("Record found ✅")
+        st.metric(label=selected_label, value=str(value))
+
+        # ---- Policy note (shown only for Prelim Grade)
+        if selected_label.lower() == "prelim grade":
+            st.info(
+            "📌 **Important:** The Prelim Grade shown is based strictly on the computed "
+            "values in the grading sheet. **No rounding up or manual adjustment** "
+            "has been applied."
+            )
+
+
+        # ---- Transparency feature (no computation): show precomputed breakdown columns
+        detail_cols = GRADE_DETAILS.get(selected_label, [])
+        if detail_cols:
+            st.subheader("Breakdown (precomputed)")
+
+            missing = [c for c in detail_cols if c not in df.columns]
+            if missing:
+                st.warning(f"Some breakdown columns are missing in the sheet: {missing}")
+
+            present_cols = [c for c in detail_cols if c in df.columns]
+
+            # Show as metrics (quick to read)
+            for c in present_cols:
+                st.metric(label=c, value=str(row_dict.get(c, "")))
+
+            # Show as a table (optional)
+            with st.expander("View breakdown as table"):
+                # One-row table built straight from the matched row's scalars;
+                # no column projection or copy of the matches DataFrame.
+                safe_df = pd.DataFrame(
+                    {
+                        ID_COL: [row_dict[ID_COL]],
+                        selected_label: [row_dict[target_col]],
+                        **{c: [row_dict[c]] for c in present_cols},
+                    }
+                )
+                st.dataframe(safe_df, hide_index=True)
+
+        # ---- Original details (kept)
+        with st.expander("Details"):
+            safe_df = pd.DataFrame(
+                {"ID Number": [row_dict[ID_COL]], selected_label: [row_dict[target_col]]}
+            )
             st.dataframe(safe_df, hide_index=True)
 
-    # ---- Original details (kept)
-    with st.expander("Details"):
-        safe_df = matches[[ID_COL, target_col]].copy()
-        safe_df.columns = ["ID Number", selected_label]
-        st.dataframe(safe_df, hide_index=True)
+lookup_fragment()